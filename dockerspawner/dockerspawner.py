@@ -2,12 +2,16 @@
 A Spawner for JupyterHub that runs each user's server in a separate docker container
 """
 from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import inspect
 from io import BytesIO
 import os
 from pprint import pformat
 import string
+import sys
 from tarfile import TarFile, TarInfo
 from textwrap import dedent
+import threading
 from urllib.parse import urlparse
 import warnings
 
@@ -16,7 +20,6 @@ from docker.errors import APIError
 from docker.utils import kwargs_from_env
 from tornado import gen, web
 
-from escapism import escape
 from jupyterhub.spawner import Spawner
 from traitlets import (
     Any,
@@ -45,15 +48,62 @@ class UnicodeOrFalse(Unicode):
         return super(UnicodeOrFalse, self).validate(obj, value)
 
 
+class _LazyPformat:
+    """Pretty-format an object only when a log message is emitted"""
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return pformat(self.obj)
+
+
+class _EscapeTable(dict):
+    """str.translate table escaping characters outside a safe set
+
+    Produces the same output as escapism.escape:
+    each utf8 byte of an unsafe character is replaced by
+    the escape character followed by the byte's hex value.
+    Entries are computed on first use of each character.
+    """
+
+    def __init__(self, safe, escape_char):
+        super().__init__()
+        self.safe = safe
+        self.escape_char = escape_char
+
+    def __missing__(self, key):
+        c = chr(key)
+        if c in self.safe and c != self.escape_char:
+            value = c
+        else:
+            value = "".join(
+                "%s%X" % (self.escape_char, byte) for byte in c.encode("utf8")
+            )
+        self[key] = value
+        return value
+
+
+@lru_cache()
+def _escape_table(safe, escape_char):
+    """Return the shared translation table for a safe set and escape char"""
+    return _EscapeTable(safe, escape_char)
+
+
 import jupyterhub
 
 _jupyterhub_xy = "%i.%i" % (jupyterhub.version_info[:2])
 
+_client_has_max_pool_size = (
+    "max_pool_size" in inspect.signature(docker.APIClient).parameters
+)
+
 
 class DockerSpawner(Spawner):
     """A Spawner for JupyterHub that runs each user's server in a separate docker container"""
 
     _executor = None
+    _executor_lock = threading.Lock()
 
     _deprecated_aliases = {
         "container_ip": ("host_ip", "0.9.*"),
@@ -86,30 +136,71 @@ class DockerSpawner(Spawner):
             setattr(self, new_attr, change.new)
 
 
+    executor_workers = Int(
+        min=1,
+        config=True,
+        help="""Number of threads to use for talking to the docker API.
+
+        Docker API calls are made in background threads,
+        shared by all servers of this Spawner class,
+        so that calls for different users can run concurrently.
+        Lower this if your docker daemon cannot handle
+        that many concurrent requests.
+
+        Default: twice the number of CPUs, but at least 4.
+        Only the value at the time of the first docker call takes effect,
+        since the pool is shared by all DockerSpawner subclasses.
+        """,
+    )
+
+    @default("executor_workers")
+    def _default_executor_workers(self):
+        return max(4, (os.cpu_count() or 2) * 2)
+
     @property
     def executor(self):
-        """single global executor"""
-        cls = self.__class__
-        if cls._executor is None:
-            cls._executor = ThreadPoolExecutor(1)
-        return cls._executor
+        """single global executor
+
+        shared by DockerSpawner and all its subclasses
+        """
+        if DockerSpawner._executor is None:
+            with DockerSpawner._executor_lock:
+                if DockerSpawner._executor is None:
+                    kwargs = {"max_workers": self.executor_workers}
+                    if sys.version_info >= (3, 6):
+                        kwargs["thread_name_prefix"] = "dockerspawner"
+                    DockerSpawner._executor = ThreadPoolExecutor(**kwargs)
+        return DockerSpawner._executor
 
     _client = None
+    _client_lock = threading.Lock()
+    # bound methods of _client, by name
+    _client_methods = None
 
     @property
     def client(self):
         """single global client instance"""
         cls = self.__class__
         if cls._client is None:
-            kwargs = {"version": "auto"}
-            if self.tls_config:
-                kwargs["tls"] = docker.tls.TLSConfig(**self.tls_config)
-            kwargs.update(kwargs_from_env())
-            kwargs.update(self.client_kwargs)
-            client = docker.APIClient(**kwargs)
-            cls._client = client
+            with cls._client_lock:
+                if cls._client is None:
+                    cls._client_methods = {}
+                    cls._client = self._create_client()
         return cls._client
 
+    def _create_client(self):
+        """Create the docker APIClient shared by all instances"""
+        kwargs = {"version": "auto"}
+        if _client_has_max_pool_size:
+            # allow one connection per executor thread
+            # (max_pool_size requires docker-py >= 4.4)
+            kwargs["max_pool_size"] = self.executor_workers
+        if self.tls_config:
+            kwargs["tls"] = docker.tls.TLSConfig(**self.tls_config)
+        kwargs.update(kwargs_from_env())
+        kwargs.update(self.client_kwargs)
+        return docker.APIClient(**kwargs)
+
     # notice when user has set the command
     # default command is that of the container,
     # but user can override it via config
@@ -542,7 +633,7 @@ class DockerSpawner(Spawner):
         config=True, help="Additional args to create_host_config for container create"
     )
 
-    _docker_safe_chars = set(string.ascii_letters + string.digits + "-")
+    _docker_safe_chars = frozenset(string.ascii_letters + string.digits + "-")
     _docker_escape_char = "_"
 
     hub_ip_connect = Unicode(
@@ -676,6 +767,33 @@ class DockerSpawner(Spawner):
 
         return None
 
+    # traits that volume names and binds are computed from
+    _volume_traits = (
+        "volumes",
+        "read_only_volumes",
+        "format_volume_name",
+        "certs_volume_name",
+        "image",
+        "prefix",
+    )
+
+    _volume_binds = None
+    _volume_mount_points = None
+
+    @observe(*_volume_traits)
+    def _volume_traits_changed(self, change):
+        self._clear_volume_cache()
+
+    def _clear_volume_cache(self):
+        """invalidate cached volume binds and mount points
+
+        Called at the start of each spawn,
+        so that in-place changes to volumes take effect,
+        and whenever a trait they depend on is set.
+        """
+        self._volume_binds = None
+        self._volume_mount_points = None
+
     @property
     def volume_mount_points(self):
         """
@@ -685,8 +803,13 @@ class DockerSpawner(Spawner):
 
         Returns a sorted list of all the values in self.volumes or
         self.read_only_volumes.
+        The result is cached along with volume_binds.
         """
-        return sorted([value["bind"] for value in self.volume_binds.values()])
+        if self._volume_mount_points is None:
+            self._volume_mount_points = sorted(
+                value["bind"] for value in self.volume_binds.values()
+            )
+        return self._volume_mount_points
 
     @property
     def volume_binds(self):
@@ -700,16 +823,22 @@ class DockerSpawner(Spawner):
             }
 
         Mode may be 'ro', 'rw', 'z', or 'Z'.
+
+        The result is cached until one of the traits it depends on changes.
         """
-        binds = self._volumes_to_binds(self.volumes, {})
-        read_only_volumes = {}
-        # FIXME: replace getattr with self.internal_ssl
-        # when minimum jupyterhub is 1.0
-        if getattr(self, 'internal_ssl', False):
-            # add SSL volume as read-only
-            read_only_volumes[self.certs_volume_name] = '/certs'
-        read_only_volumes.update(self.read_only_volumes)
-        return self._volumes_to_binds(read_only_volumes, binds, mode="ro")
+        if self._volume_binds is None:
+            binds = self._volumes_to_binds(self.volumes, {})
+            read_only_volumes = {}
+            # FIXME: replace getattr with self.internal_ssl
+            # when minimum jupyterhub is 1.0
+            if getattr(self, 'internal_ssl', False):
+                # add SSL volume as read-only
+                read_only_volumes[self.certs_volume_name] = '/certs'
+            read_only_volumes.update(self.read_only_volumes)
+            self._volume_binds = self._volumes_to_binds(
+                read_only_volumes, binds, mode="ro"
+            )
+        return self._volume_binds
 
     _escaped_name = None
 
@@ -720,26 +849,37 @@ class DockerSpawner(Spawner):
             self._escaped_name = self._escape(self.user.name)
         return self._escaped_name
 
+    _escaped_server_name = None
+
+    @property
+    def escaped_server_name(self):
+        """Escape the server name so it's safe for docker objects"""
+        if self._escaped_server_name is None:
+            self._escaped_server_name = self._escape(
+                getattr(self, "name", "").lower()
+            )
+        return self._escaped_server_name
+
     def _escape(self, s):
         """Escape a string to docker-safe characters"""
-        return escape(
-            s,
-            safe=self._docker_safe_chars,
-            escape_char=self._docker_escape_char,
+        # frozenset() is a no-op unless a subclass overrides
+        # _docker_safe_chars with a mutable set
+        table = _escape_table(
+            frozenset(self._docker_safe_chars), self._docker_escape_char
         )
+        return s.translate(table)
 
     object_id = Unicode(allow_none=True)
 
     def template_namespace(self):
         escaped_image = self.image.replace("/", "_")
         server_name = getattr(self, "name", "")
-        safe_server_name = self._escape(server_name.lower())
         return {
             "username": self.escaped_name,
             "safe_username": self.escaped_name,
             "raw_username": self.user.name,
             "imagename": escaped_image,
-            "servername": safe_server_name,
+            "servername": self.escaped_server_name,
             "raw_servername": server_name,
             "prefix": self.prefix,
         }
@@ -787,10 +927,12 @@ class DockerSpawner(Spawner):
         if self.hub_ip_connect:
             # JupyterHub 0.7 specifies --hub-api-url
             # on the command-line, which is hard to update
-            for idx, arg in enumerate(list(args)):
-                if arg.startswith("--hub-api-url="):
-                    args.pop(idx)
-                    break
+            idx = next(
+                (i for i, arg in enumerate(args) if arg.startswith("--hub-api-url=")),
+                None,
+            )
+            if idx is not None:
+                args.pop(idx)
 
             args.append("--hub-api-url=%s" % self._public_hub_api_url())
         return args
@@ -805,7 +947,11 @@ class DockerSpawner(Spawner):
 
         to be passed to ThreadPoolExecutor
         """
-        m = getattr(self.client, method)
+        client = self.client
+        methods = self._client_methods
+        m = methods.get(method)
+        if m is None:
+            m = methods[method] = getattr(client, method)
         return m(*args, **kwargs)
 
     def docker(self, method, *args, **kwargs):
@@ -825,7 +971,9 @@ class DockerSpawner(Spawner):
 
         container_state = container["State"]
         self.log.debug(
-            "Container %s status: %s", self.container_id[:7], pformat(container_state)
+            "Container %s status: %s",
+            self.container_id[:7],
+            _LazyPformat(container_state),
         )
 
         if container_state["Running"]:
@@ -1000,6 +1148,26 @@ class DockerSpawner(Spawner):
                 self.log.info("pulling image %s", image)
                 yield self.docker('pull', repo, tag)
 
+    @gen.coroutine
+    def _get_reusable_object(self):
+        """Get our existing container/service, if it can be reused
+
+        If `remove` is True, an existing object is removed
+        and None is returned.
+        """
+        obj = yield self.get_object()
+        if obj and self.remove:
+            self.log.warning(
+                "Removing %s that should have been cleaned up: %s (id: %s)",
+                self.object_type,
+                self.object_name,
+                self.object_id[:7],
+            )
+            yield self.remove_object()
+
+            obj = None
+        return obj
+
     @gen.coroutine
     def start(self, image=None, extra_create_kwargs=None, extra_host_config=None):
         """Start the single-user server in a docker container.
@@ -1011,6 +1179,9 @@ class DockerSpawner(Spawner):
         the container is removed first. Otherwise, the existing containers
         will be restarted.
         """
+        # recompute volumes once per start,
+        # in case they were modified in-place since the last one
+        self._clear_volume_cache()
 
         if image:
             self.log.warning("Specifying image via .start args is deprecated")
@@ -1035,22 +1206,33 @@ class DockerSpawner(Spawner):
             self.image = yield self.check_allowed(image_option)
 
         image = self.image
-        yield self.pull_image(image)
-
-        obj = yield self.get_object()
-        if obj and self.remove:
-            self.log.warning(
-                "Removing %s that should have been cleaned up: %s (id: %s)",
-                self.object_type,
-                self.object_name,
-                self.object_id[:7],
+        if self.object_id:
+            # pulling the image and looking up our object are independent,
+            # so do both at once
+            _, obj = yield gen.multi(
+                [self.pull_image(image), self._get_reusable_object()]
             )
-            yield self.remove_object()
-
+        else:
+            yield self.pull_image(image)
+            # nothing recorded in our state, so skip the lookup.
+            # If an object with our name exists anyway,
+            # creating it fails with a conflict and we look it up then.
             obj = None
 
+        created = False
         if obj is None:
-            obj = yield self.create_object()
+            try:
+                obj = yield self.create_object()
+                created = True
+            except APIError as e:
+                if self.object_id or e.status_code != 409:
+                    raise
+                obj = yield self._get_reusable_object()
+                if obj is None:
+                    obj = yield self.create_object()
+                    created = True
+
+        if created:
             self.object_id = obj[self.object_id_key]
             self.log.info(
                 "Created %s %s (id: %s) from image %s",
@@ -1193,17 +1375,15 @@ class DockerSpawner(Spawner):
 
             {'/host/dir': {'bind': '/guest/dir': 'mode': 'rw'}}
         """
-
-        def _fmt(v):
-            return self.format_volume_name(v, self)
+        fmt = self.format_volume_name
 
         for k, v in volumes.items():
-            m = mode
             if isinstance(v, dict):
-                if "mode" in v:
-                    m = v["mode"]
+                m = v.get("mode", mode)
                 v = v["bind"]
-            binds[_fmt(k)] = {"bind": _fmt(v), "mode": m}
+            else:
+                m = mode
+            binds[fmt(k, self)] = {"bind": fmt(v, self), "mode": m}
         return binds
 
 
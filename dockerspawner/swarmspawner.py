@@ -10,9 +10,78 @@ from docker.types import (
 )
 from docker.errors import APIError
 from tornado import gen
-from traitlets import Dict, Unicode, default
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+from traitlets import Dict, Unicode, default, observe
 
-from .dockerspawner import DockerSpawner
+from .dockerspawner import DockerSpawner, _LazyPformat
+
+# task states for which poll considers the server to be running
+_ACTIVE_TASK_STATES = frozenset({"running", "starting", "pending", "preparing"})
+# task states for which start waits before checking again
+_PENDING_TASK_STATES = frozenset(
+    {"new", "assigned", "accepted", "starting", "pending", "preparing", "ready", "rejected"}
+)
+
+
+class _RunningTasksBatcher:
+    """Coalesce lookups of running tasks into one docker request
+
+    Lookups made while a request is in flight are queued
+    and sent together, filtered by service id, in the next request.
+    This way many spawners polling at once (e.g. at Hub startup)
+    cost one `tasks` request instead of one each.
+
+    All methods must be called from the IOLoop thread.
+    """
+
+    def __init__(self):
+        # service id: Future for its list of running tasks
+        self._pending = {}
+        self._flushing = False
+
+    def get(self, spawner):
+        """Return a Future for the running tasks of spawner's service
+
+        Resolves to None if the batched request failed,
+        in which case the caller should make its own request.
+        """
+        service_id = spawner.service_id
+        f = self._pending.get(service_id)
+        if f is None:
+            f = self._pending[service_id] = Future()
+        if not self._flushing:
+            self._flushing = True
+            IOLoop.current().add_callback(self._flush, spawner)
+        return f
+
+    @gen.coroutine
+    def _flush(self, spawner):
+        try:
+            while self._pending:
+                pending = self._pending
+                self._pending = {}
+                try:
+                    tasks = yield spawner.docker(
+                        "tasks",
+                        filters={"service": list(pending), "desired-state": "running"},
+                    )
+                    by_service = {service_id: [] for service_id in pending}
+                    for task in tasks:
+                        service_tasks = by_service.get(task["ServiceID"])
+                        if service_tasks is not None:
+                            service_tasks.append(task)
+                except Exception as e:
+                    # e.g. 404 if any one of the services is gone.
+                    # Every waiter must be resolved, so they fall back
+                    # to their own requests.
+                    spawner.log.debug("Batched task lookup failed: %s", e)
+                    by_service = {}
+                for service_id, f in pending.items():
+                    if not f.done():
+                        f.set_result(by_service.get(service_id))
+        finally:
+            self._flushing = False
 
 
 class SwarmSpawner(DockerSpawner):
@@ -96,29 +165,47 @@ class SwarmSpawner(DockerSpawner):
     # container-removal cannot be disabled for services
     remove = True
 
+    _mount_driver_config = None
+    _mounts = None
+
+    @observe("volume_driver", "volume_driver_options")
+    def _volume_driver_changed(self, change):
+        self._clear_volume_cache()
+
+    def _clear_volume_cache(self):
+        """invalidate cached volume binds, mount points and mounts"""
+        super()._clear_volume_cache()
+        self._mounts = None
+        self._mount_driver_config = None
+
     @property
     def mount_driver_config(self):
-        return DriverConfig(
-            name=self.volume_driver, options=self.volume_driver_options or None
-        )
+        if self._mount_driver_config is None:
+            self._mount_driver_config = DriverConfig(
+                name=self.volume_driver, options=self.volume_driver_options or None
+            )
+        return self._mount_driver_config
 
     @property
     def mounts(self):
-        if len(self.volume_binds):
-            driver = self.mount_driver_config
-            return [
-                Mount(
-                    target=vol["bind"],
-                    source=host_loc,
-                    type="bind",
-                    read_only=vol["mode"] == "ro",
-                    driver_config=driver,
-                )
-                for host_loc, vol in self.volume_binds.items()
-            ]
+        if self._mounts is None:
+            binds = self.volume_binds
+            if binds:
+                driver = self.mount_driver_config
+                self._mounts = [
+                    Mount(
+                        target=vol["bind"],
+                        source=host_loc,
+                        type="bind",
+                        read_only=vol["mode"] == "ro",
+                        driver_config=driver,
+                    )
+                    for host_loc, vol in binds.items()
+                ]
 
-        else:
-            return []
+            else:
+                self._mounts = []
+        return self._mounts
 
     @gen.coroutine
     def poll(self):
@@ -130,32 +217,44 @@ class SwarmSpawner(DockerSpawner):
 
         service_state = service["Status"]
         self.log.debug(
-            "Service %s status: %s", self.service_id[:7], pformat(service_state)
+            "Service %s status: %s",
+            self.service_id[:7],
+            _LazyPformat(service_state),
         )
 
-        if service_state["State"] in {"running", "starting", "pending", "preparing"}:
+        if service_state["State"] in _ACTIVE_TASK_STATES:
             return None
 
         else:
             return pformat(service_state)
 
+    _running_tasks_batcher = None
+
+    def _get_running_tasks(self):
+        """Look up the running tasks of our service via the shared batcher"""
+        cls = self.__class__
+        if cls._running_tasks_batcher is None:
+            cls._running_tasks_batcher = _RunningTasksBatcher()
+        return cls._running_tasks_batcher.get(self)
+
     @gen.coroutine
     def get_task(self):
         self.log.debug("Getting task of service '%s'", self.service_name)
-        if self.get_object() is None:
-            return None
-
         try:
-            tasks = yield self.docker(
-                "tasks",
-                filters={"service": self.service_name, "desired-state": "running"},
-            )
-            if len(tasks) == 0:
+            tasks = None
+            if self.service_id:
+                tasks = yield self._get_running_tasks()
+            if tasks is None:
+                tasks = yield self.docker(
+                    "tasks",
+                    filters={"service": self.service_name, "desired-state": "running"},
+                )
+            if not tasks:
                 tasks = yield self.docker(
                     "tasks",
                     filters={"service": self.service_name},
                 )
-                if len(tasks) == 0:
+                if not tasks:
                     return None
 
             elif len(tasks) > 1:
@@ -190,10 +289,12 @@ class SwarmSpawner(DockerSpawner):
         resources_kwargs = dict(
             mem_limit=self.mem_limit,
             mem_reservation=self.mem_guarantee,
-            cpu_limit=int(self.cpu_limit * 1e9) if self.cpu_limit else None,
-            cpu_reservation=int(
-                self.cpu_guarantee * 1e9
-            ) if self.cpu_guarantee else None,
+            # docker takes cpus in units of 1e-9 cpus.
+            # round to avoid int(1.001 * 1e9) == 1000999999
+            cpu_limit=round(self.cpu_limit * 10 ** 9) if self.cpu_limit else None,
+            cpu_reservation=(
+                round(self.cpu_guarantee * 10 ** 9) if self.cpu_guarantee else None
+            ),
         )
         resources_kwargs.update(self.extra_resources_spec)
         resources_spec = Resources(**resources_kwargs)
@@ -233,7 +334,7 @@ class SwarmSpawner(DockerSpawner):
                 "tasks",
                 filters={"service": self.service_name},
             )
-            if len(tasks) > 0:
+            if tasks:
                 break
             yield gen.sleep(1.0)
 
@@ -270,7 +371,7 @@ class SwarmSpawner(DockerSpawner):
             status = service["Status"]
             state = status["State"].lower()
             self.log.debug("Service %s state: %s", self.service_id[:7], state)
-            if state in {"new", "assigned", "accepted", "starting", "pending", "preparing", "ready", "rejected"}:
+            if state in _PENDING_TASK_STATES:
                 # not ready yet, wait before checking again
                 yield gen.sleep(dt)
                 # exponential backoff
@@ -95,8 +95,8 @@ class SystemUserSpawner(DockerSpawner):
         self.read_only_volumes.
         """
         mount_points = super(SystemUserSpawner, self).volume_mount_points
-        mount_points.append(self.homedir)
-        return mount_points
+        # copy, don't modify the cached list from DockerSpawner
+        return mount_points + [self.homedir]
 
     @property
     def volume_binds(self):
@@ -109,7 +109,8 @@ class SystemUserSpawner(DockerSpawner):
                 host_location: {'bind': container_location, 'ro': True}
             }
         """
-        volumes = super(SystemUserSpawner, self).volume_binds
+        # copy, don't modify the cached dict from DockerSpawner
+        volumes = dict(super(SystemUserSpawner, self).volume_binds)
         volumes[self.host_homedir] = {
             'bind': self.homedir,
             'ro': False
@@ -2,8 +2,11 @@
 
 import asyncio
 import json
+import types
+from unittest import mock
 
 import docker
+from docker.errors import APIError
 import pytest
 from jupyterhub.tests.test_api import add_user, api_request
 from jupyterhub.tests.mocking import public_url
@@ -31,6 +34,119 @@ def test_name_collision(dockerspawner_configured_app):
     assert spawner1.object_name != spawner2.object_name
 
 
+@pytest.mark.parametrize(
+    "name, escaped",
+    [
+        ("user-foo", "user-foo"),
+        ("has@", "has_40"),
+        ("under_score", "under_5Fscore"),
+        ("caf\u00e9", "caf_C3_A9"),
+    ],
+)
+def test_escape(name, escaped):
+    spawner = DockerSpawner()
+    assert spawner._escape(name) == escaped
+
+
+def _api_error(status_code):
+    return APIError("error", response=mock.Mock(status_code=status_code))
+
+
+def _mock_start(spawner, existing=None, create_errors=()):
+    """Mock docker calls made by DockerSpawner.start
+
+    `existing` is the container returned by inspect_container,
+    `create_errors` are raised by the first calls to create_object.
+
+    Returns the list of calls made.
+    """
+    calls = []
+    create_errors = list(create_errors)
+
+    async def fake_docker(method, *args, **kwargs):
+        calls.append(method)
+        if method == "inspect_container":
+            if existing is None:
+                raise _api_error(404)
+            return existing
+        elif method == "remove_container":
+            return None
+        raise AssertionError("unexpected docker call: %s" % method)
+
+    async def create_object():
+        calls.append("create_object")
+        if create_errors:
+            raise create_errors.pop(0)
+        return {"Id": "new-id"}
+
+    async def noop(*args):
+        pass
+
+    async def get_ip_and_port():
+        return ("127.0.0.1", 8888)
+
+    spawner.user = types.SimpleNamespace(name="joe")
+    for name, f in [
+        ("docker", fake_docker),
+        ("create_object", create_object),
+        ("pull_image", noop),
+        ("start_object", noop),
+        ("get_ip_and_port", get_ip_and_port),
+    ]:
+        setattr(spawner, name, f)
+    return calls
+
+
+async def test_start_untracked_no_conflict():
+    spawner = DockerSpawner()
+    calls = _mock_start(spawner)
+    assert await spawner.start() == ("127.0.0.1", 8888)
+    # no lookup without an object id in state
+    assert calls == ["create_object"]
+    assert spawner.object_id == "new-id"
+
+
+async def test_start_untracked_conflict_remove():
+    spawner = DockerSpawner(remove=True)
+    calls = _mock_start(
+        spawner,
+        existing={"Id": "old-id", "Config": {"Env": []}},
+        create_errors=[_api_error(409)],
+    )
+    await spawner.start()
+    assert calls == [
+        "create_object",
+        "inspect_container",
+        "remove_container",
+        "create_object",
+    ]
+    assert spawner.object_id == "new-id"
+
+
+async def test_start_untracked_conflict_reuse():
+    spawner = DockerSpawner(remove=False)
+    calls = _mock_start(
+        spawner,
+        existing={
+            "Id": "old-id",
+            "Config": {"Env": ["JUPYTERHUB_API_TOKEN=old-token"]},
+        },
+        create_errors=[_api_error(409)],
+    )
+    await spawner.start()
+    assert calls == ["create_object", "inspect_container"]
+    assert spawner.object_id == "old-id"
+    assert spawner.api_token == "old-token"
+
+
+async def test_start_create_error():
+    spawner = DockerSpawner()
+    calls = _mock_start(spawner, create_errors=[_api_error(500)])
+    with pytest.raises(APIError):
+        await spawner.start()
+    assert calls == ["create_object"]
+
+
 async def test_start_stop(dockerspawner_configured_app):
     app = dockerspawner_configured_app
     name = "has@"
@@ -1,12 +1,18 @@
 """Tests for SwarmSpawner"""
 
+import asyncio
+import logging
+import types
+from unittest import mock
+
 import pytest
 from jupyterhub.tests.test_api import add_user, api_request
 from jupyterhub.tests.mocking import public_url
 from jupyterhub.utils import url_path_join
 from tornado.httpclient import AsyncHTTPClient
 
-from dockerspawner import SwarmSpawner
+from dockerspawner import DockerSpawner, SwarmSpawner
+from dockerspawner.swarmspawner import _RunningTasksBatcher
 
 # Mark all tests in this file as asyncio
 pytestmark = pytest.mark.asyncio
@@ -36,3 +42,125 @@ async def test_start_stop(swarmspawner_configured_app):
     assert resp.effective_url == url
     resp.rethrow()
     assert "kernels" in resp.body.decode("utf-8")
+
+
+def test_executor_shared():
+    assert SwarmSpawner().executor is DockerSpawner().executor
+
+
+async def test_cpu_limit_nanocpus():
+    spawner = SwarmSpawner(cpu_limit=1.001, cpu_guarantee=0.5)
+    spawner.user = types.SimpleNamespace(name="joe")
+    calls = {}
+
+    async def docker(method, *args, **kwargs):
+        calls[method] = kwargs
+        if method == "create_service":
+            return {"ID": "abc"}
+        return [{}]
+
+    async def get_command():
+        return ["jupyterhub-singleuser"]
+
+    with mock.patch.object(spawner, "docker", docker), mock.patch.object(
+        spawner, "get_command", get_command
+    ), mock.patch.object(spawner, "get_env", lambda: {}):
+        await spawner.create_object()
+
+    resources = calls["create_service"]["task_template"]["Resources"]
+    assert resources["Limits"]["NanoCPUs"] == 1001000000
+    assert resources["Reservations"]["NanoCPUs"] == 500000000
+
+
+class _FakeTasksDocker:
+    """Fake docker method for the 'tasks' requests of _RunningTasksBatcher
+
+    Records the requested service ids (sorted, since the batcher
+    doesn't guarantee their order), and blocks each request
+    until `release` is set.
+    """
+
+    def __init__(self, tasks=None, error=None):
+        self.calls = []
+        self.release = asyncio.Event()
+        self.release.set()
+        self.tasks = tasks
+        self.error = error
+
+    async def __call__(self, method, filters):
+        assert method == "tasks"
+        assert filters["desired-state"] == "running"
+        self.calls.append(sorted(filters["service"]))
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        if self.tasks is not None:
+            return self.tasks
+        return [{"ServiceID": service_id} for service_id in filters["service"]]
+
+    def spawner(self, service_id):
+        return types.SimpleNamespace(
+            service_id=service_id, docker=self, log=logging.getLogger(__name__)
+        )
+
+
+async def test_batcher_concurrent_gets_share_request():
+    docker = _FakeTasksDocker()
+    batcher = _RunningTasksBatcher()
+    results = await asyncio.wait_for(
+        asyncio.gather(*(batcher.get(docker.spawner(sid)) for sid in "abc")), 5
+    )
+    assert docker.calls == [["a", "b", "c"]]
+    assert results == [[{"ServiceID": sid}] for sid in "abc"]
+
+
+async def test_batcher_queues_while_in_flight():
+    docker = _FakeTasksDocker()
+    docker.release.clear()
+    batcher = _RunningTasksBatcher()
+    first = batcher.get(docker.spawner("a"))
+    while not docker.calls:
+        await asyncio.sleep(0)
+    # request for 'a' is in flight, these are queued for the next one
+    second = batcher.get(docker.spawner("b"))
+    third = batcher.get(docker.spawner("c"))
+    docker.release.set()
+    results = await asyncio.wait_for(asyncio.gather(first, second, third), 5)
+    assert docker.calls == [["a"], ["b", "c"]]
+    assert results == [[{"ServiceID": sid}] for sid in "abc"]
+
+
+async def test_batcher_splits_tasks_by_service():
+    docker = _FakeTasksDocker(
+        tasks=[
+            {"ServiceID": "a", "ID": "1"},
+            {"ServiceID": "other", "ID": "2"},
+            {"ServiceID": "a", "ID": "3"},
+        ]
+    )
+    batcher = _RunningTasksBatcher()
+    results = await asyncio.wait_for(
+        asyncio.gather(*(batcher.get(docker.spawner(sid)) for sid in "ab")), 5
+    )
+    assert results == [
+        [{"ServiceID": "a", "ID": "1"}, {"ServiceID": "a", "ID": "3"}],
+        [],
+    ]
+
+
+@pytest.mark.parametrize(
+    "docker_kwargs",
+    [
+        {"error": RuntimeError("service not found")},
+        # malformed task
+        {"tasks": [{"ID": "1"}]},
+    ],
+)
+async def test_batcher_failure_falls_back(docker_kwargs):
+    docker = _FakeTasksDocker(**docker_kwargs)
+    batcher = _RunningTasksBatcher()
+    results = await asyncio.wait_for(
+        asyncio.gather(*(batcher.get(docker.spawner(sid)) for sid in "ab")), 5
+    )
+    assert docker.calls == [["a", "b"]]
+    assert results == [None, None]
@@ -25,6 +25,43 @@ def test_binds(monkeypatch):
     assert d.volume_mount_points == ["/home/xyz"]
 
 
+def test_binds_cached():
+    from dockerspawner.dockerspawner import DockerSpawner
+
+    d = DockerSpawner()
+    d.user = types.SimpleNamespace(name="xyz")
+    d.volumes = {"/nfs/{username}": "/home/{username}"}
+    binds = d.volume_binds
+    mount_points = d.volume_mount_points
+    assert d.volume_binds is binds
+    assert d.volume_mount_points is mount_points
+    d.read_only_volumes = {"/data": "/data"}
+    assert d.volume_binds is not binds
+    assert d.volume_mount_points == ["/data", "/home/xyz"]
+    assert d.volume_binds == {
+        "/nfs/xyz": {"bind": "/home/xyz", "mode": "rw"},
+        "/data": {"bind": "/data", "mode": "ro"},
+    }
+
+
+def test_binds_recomputed_after_clear():
+    from dockerspawner.dockerspawner import DockerSpawner
+
+    d = DockerSpawner()
+    d.user = types.SimpleNamespace(name="xyz")
+    d.volumes = {"/a": "/b"}
+    assert d.volume_binds == {"/a": {"bind": "/b", "mode": "rw"}}
+    # in-place changes are picked up on the next start,
+    # which clears the cache
+    d.volumes["/c"] = "/d"
+    d._clear_volume_cache()
+    assert d.volume_binds == {
+        "/a": {"bind": "/b", "mode": "rw"},
+        "/c": {"bind": "/d", "mode": "rw"},
+    }
+    assert d.volume_mount_points == ["/b", "/d"]
+
+
 def test_volume_naming_configuration(monkeypatch):
     from dockerspawner.dockerspawner import DockerSpawner
 
@@ -40,6 +77,38 @@ def test_volume_naming_configuration(monkeypatch):
     assert d.volume_mount_points == ["THIS IS A TEST"]
 
 
+def test_volume_names_formatted_once_per_start():
+    """Templates are formatted once per start, not on every access
+
+    The cache is cleared at the start of each spawn,
+    so templates are formatted again for the next one.
+    """
+    from dockerspawner.dockerspawner import DockerSpawner
+
+    d = DockerSpawner()
+    d.user = types.SimpleNamespace(name="joe")
+    d.volumes = {"data/{username}": "/home/{username}"}
+    d.read_only_volumes = {"/shared": "/shared"}
+    calls = []
+
+    def counting_format(label_template, spawner):
+        calls.append(label_template)
+        return label_template.upper()
+
+    d.format_volume_name = counting_format
+    for i in range(3):
+        assert d.volume_binds == {
+            "DATA/{USERNAME}": {"bind": "/HOME/{USERNAME}", "mode": "rw"},
+            "/SHARED": {"bind": "/SHARED", "mode": "ro"},
+        }
+        d.volume_mount_points
+    assert len(calls) == 4
+    # as done by start()
+    d._clear_volume_cache()
+    d.volume_binds
+    assert len(calls) == 8
+
+
 def test_default_format_volume_name(monkeypatch):
     from dockerspawner.dockerspawner import DockerSpawner
 
@@ -70,5 +139,34 @@ def test_escaped_format_volume_name(monkeypatch):
     assert d.volume_mount_points == ["/home/user_40email_2Ecom"]
 
 
+def test_system_user_mount_points():
+    from dockerspawner import SystemUserSpawner
+
+    d = SystemUserSpawner()
+    d.user = types.SimpleNamespace(name="joe")
+    d.volumes = {"/a": "/b"}
+    mount_points = list(d.volume_mount_points)
+    assert "/b" in mount_points
+    assert "/home/joe" in mount_points
+    # repeated access must not keep adding the home directory
+    assert d.volume_mount_points == mount_points
+
+
+def test_system_user_binds():
+    from dockerspawner import DockerSpawner, SystemUserSpawner
+
+    d = SystemUserSpawner()
+    d.user = types.SimpleNamespace(name="joe")
+    d.volumes = {"/a": "/b"}
+    expected = {
+        "/a": {"bind": "/b", "mode": "rw"},
+        "/home/joe": {"bind": "/home/joe", "ro": False},
+    }
+    assert d.volume_binds == expected
+    assert d.volume_binds == expected
+    # the cached binds from DockerSpawner are not modified
+    assert DockerSpawner.volume_binds.fget(d) == {"/a": {"bind": "/b", "mode": "rw"}}
+
+
 class _MockSpawner(LoggingConfigurable):
     pass